@@ -1,3 +1,10 @@
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+
 class Dragon:
     def __init__(self, name):
         self.name = name
@@ -17,8 +24,104 @@ class Dragon:
     def final_cry(self):
         print(self.name, 'is dead...')
 
+
+class DragonPool:
+    """
+    Health of many dragons kept in one NumPy array, with the same rules as Dragon:
+    damage is subtracted, health doesn't go below zero, and a dragon with zero health is dead.
+    """
+    def __init__(self, names, health=100):
+        self.names = list(names)
+        self.health = np.full(len(self.names), health, dtype=np.int64)
+
+    def is_alive(self):
+        """
+        :return: bool array, whether each dragon is alive
+        """
+        return self.health > 0
+
+    def get_damage(self, enemy_ids, damage):
+        """
+        Applies a batch of hits in their order. Hits on dead dragons are ignored,
+        as main() removes a dead dragon from the list.
+        :param enemy_ids: index of the hit dragon for every hit
+        :param damage: damage of every hit
+        :return: indices of the hits that killed a dragon, in order
+        """
+        enemy_ids = np.asarray(enemy_ids, dtype=np.int64)
+        damage = np.asarray(damage, dtype=np.int64)
+        hits = np.flatnonzero(self.health[enemy_ids] > 0)
+        # Hits grouped by dragon, in their order within a group
+        order = hits[np.argsort(enemy_ids[hits], kind="stable")]
+        ids = enemy_ids[order]
+        total = np.cumsum(damage[order])
+        if len(ids) == 0:
+            return order
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(ids)] - 1
+        group = np.repeat(np.arange(len(starts)), ends - starts + 1)
+        # Health after every hit, as long as the dragon is alive
+        left = self.health[ids] - (total - (total[starts] - damage[order[starts]])[group])
+        dead = np.flatnonzero(left <= 0)
+        killing = dead[np.r_[True, group[dead[1:]] != group[dead[:-1]]]] if len(dead) else dead
+        self.health[ids[ends]] = left[ends]
+        self.health[ids[killing]] = 0
+        return np.sort(order[killing])
+
+    def final_cry(self, enemy_ids):
+        """
+        :return: the final cries of the given dragons as one string
+        """
+        return "".join("{} is dead...\n".format(self.names[i]) for i in enemy_ids)
+
+
+def read_events(source, chunk_size=1000000):
+    """
+    Reads (enemy_id, damage) events in chunks.
+    :param source: path of a text file with an enemy id and a damage on every line,
+        an array of shape (n, 2), or an iterable of pairs
+    :param chunk_size: number of events in a chunk
+    :return: iterator over arrays of shape (chunk_size, 2), the last one can be shorter
+    """
+    if isinstance(source, str):
+        with open(source) as f:
+            while True:
+                lines = list(itertools.islice(f, chunk_size))
+                if not lines:
+                    return
+                yield np.loadtxt(lines, dtype=np.int64, ndmin=2).reshape(-1, 2)
+    elif isinstance(source, np.ndarray):
+        for start in range(0, len(source), chunk_size):
+            yield source[start:start + chunk_size]
+    else:
+        source = iter(source)
+        while True:
+            chunk = np.array(list(itertools.islice(source, chunk_size)), dtype=np.int64).reshape(-1, 2)
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+
+def battle(pool, events, chunk_size=1000000):
+    """
+    Non-interactive version of main(): applies a stream of hits to the pool chunk by chunk,
+    without any I/O per hit.
+    :param pool: DragonPool
+    :param events: source of (enemy_id, damage) events, as for read_events
+    :return: array of (event index, enemy id) of the deaths, in order, and the number of events
+    """
+    deaths = []
+    offset = 0
+    for chunk in read_events(events, chunk_size):
+        killing = pool.get_damage(chunk[:, 0], chunk[:, 1])
+        deaths.append(np.stack((killing + offset, chunk[killing, 0]), axis=1))
+        offset += len(chunk)
+    deaths = np.concatenate(deaths) if deaths else np.zeros((0, 2), dtype=np.int64)
+    return deaths, offset
+
+
 def main():
-    
+
     enemy_list = [Dragon('Smog'), Dragon('Hidra')]
     finish = False
     while not finish:
@@ -31,9 +134,27 @@ def main():
             enemy_list.pop(0)
         if not enemy_list:  # проверить пуст ли список врагов
             finish = True
-        
+
     print('You win!')
 
-main()
-        
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", help="file with an enemy id and a damage on every line, "
+                                         "replayed without asking for input")
+    parser.add_argument("--dragons", type=int, default=2, help="number of dragons for --events")
+    args = parser.parse_args()
+
+    if args.events is None:
+        main()
+    else:
+        names = ['Smog', 'Hidra'] + ['Dragon {}'.format(i) for i in range(2, args.dragons)]
+        pool = DragonPool(names[:args.dragons])
+        start = time.perf_counter()
+        deaths, n_events = battle(pool, args.events)
+        elapsed = time.perf_counter() - start
+        print(pool.final_cry(deaths[:, 1]), end='')
+        print('{} events in {:.3f} s ({:.0f} events/s), {} of {} dragons dead'.format(
+            n_events, elapsed, n_events / max(elapsed, 1e-9), len(deaths), len(pool.names)))
+        if not pool.is_alive().any():
+            print('You win!')
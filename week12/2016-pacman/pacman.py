@@ -1,7 +1,10 @@
 import sys
+import argparse
+import numpy as np
 import pygame
 from pygame.locals import *
 from math import floor
+from collections import deque
 import random
 
 
@@ -11,31 +14,208 @@ def init_window():
     pygame.display.set_caption('Pacman')
 
 
+plain_backgrounds = {}
+
+
 def draw_background(scr, img=None):
     if img:
         scr.blit(img, (0, 0))
     else:
-        bg = pygame.Surface(scr.get_size())
-        bg.fill((128, 128, 128))
+        bg = plain_backgrounds.get(scr.get_size())
+        if bg is None:
+            bg = pygame.Surface(scr.get_size())
+            bg.fill((128, 128, 128))
+            plain_backgrounds[scr.get_size()] = bg
         scr.blit(bg, (0, 0))
 
 
-class GameObject(pygame.sprite.Sprite):
-    def __init__(self, img, x, y, tile_size, map_size):
-        pygame.sprite.Sprite.__init__(self)
-        self.image = pygame.image.load(img)
-        self.screen_rect = None
+class TileMap:
+    """Square grid of tiles loaded from a text file, '#' is a wall and '.' is a floor tile.
+
+    Walls are baked once into a static surface, and wall collision is a grid lookup.
+    """
+    WALL = '#'
+
+    def __init__(self, rows):
+        self.walls = [[c == TileMap.WALL for c in row] for row in rows]
+        self.size = len(self.walls)
+        self.static = None
+
+    @staticmethod
+    def load(path):
+        with open(path) as f:
+            return TileMap([line.strip() for line in f if line.strip()])
+
+    def is_wall(self, x, y):
+        """Checks the tile an object at (x, y) occupies. Tiles outside the map count as walls."""
+        col, row = floor(x), floor(y)
+        if col < 0 or row < 0 or col >= self.size or row >= self.size:
+            return True
+        return self.walls[row][col]
+
+    def bake(self, tile_size, background=None, wall_img='./resources/wall.png'):
+        """Draws the floor and all walls once into a cached surface of the map size."""
+        if self.static is None:
+            static = pygame.Surface((self.size * tile_size, self.size * tile_size))
+            draw_background(static, background)
+            wall = assets.image(wall_img)
+            for row, walls in enumerate(self.walls):
+                for col, is_wall in enumerate(walls):
+                    if is_wall:
+                        static.blit(wall, (col * tile_size, row * tile_size))
+            if pygame.display.get_surface() is not None:
+                static = static.convert()
+            self.static = static
+        return self.static
+
+    def wall_array(self):
+        """Walls as a boolean NumPy array indexed by [row, col]."""
+        return np.array(self.walls, dtype=bool)
+
+    def floor_tiles(self):
+        return [(col, row) for row, walls in enumerate(self.walls) for col, is_wall in enumerate(walls) if not is_wall]
+
+    def distances_from(self, col, row):
+        """Breadth-first search from a tile. Returns the grid of step distances, None for unreachable tiles."""
+        dist = [[None] * self.size for _ in range(self.size)]
+        if self.is_wall(col, row):
+            return dist
+        dist[row][col] = 0
+        queue = deque([(col, row)])
+        while queue:
+            col, row = queue.popleft()
+            d = dist[row][col] + 1
+            for dx, dy in STEPS[1:]:
+                c, r = col + dx, row + dy
+                if 0 <= c < self.size and 0 <= r < self.size and not self.walls[r][c] and dist[r][c] is None:
+                    dist[r][c] = d
+                    queue.append((c, r))
+        return dist
+
+    def all_pairs_distances(self):
+        """Distance grids from every floor tile. Worth it for small maps only."""
+        return {tile: self.distances_from(*tile) for tile in self.floor_tiles()}
+
+
+# Tile steps of the directions: 0 - stay, 1 - right, 2 - down, 3 - left, 4 - up
+STEPS = ((0, 0), (1, 0), (0, 1), (-1, 0), (0, -1))
+
+
+class FlowField:
+    """Distance map to the tile of a target, shared by all chasing ghosts.
+
+    It is recomputed only when the target enters another tile, so a ghost's choice of direction
+    is a few grid lookups. With all_pairs=True distances from every tile are precomputed, and
+    recomputing is a dictionary lookup.
+    """
+    def __init__(self, tile_map, all_pairs=False):
+        self.tile_map = tile_map
+        self.all_pairs = tile_map.all_pairs_distances() if all_pairs else None
+        self.target = None
+        self.dist = None
+
+    def update(self, x, y):
+        tile = (floor(x), floor(y))
+        if tile == self.target:
+            return
+        self.target = tile
+        if self.all_pairs is not None and tile in self.all_pairs:
+            self.dist = self.all_pairs[tile]
+        else:
+            self.dist = self.tile_map.distances_from(*tile)
+
+    def direction(self, x, y):
+        """Returns the direction to the neighbouring tile closest to the target, 0 if there is none."""
+        if self.dist is None:
+            return 0
+        col, row = floor(x), floor(y)
+        size = self.tile_map.size
+        best = self.dist[row][col] if 0 <= col < size and 0 <= row < size else None
+        direction = 0
+        for i in range(1, 5):
+            c, r = col + STEPS[i][0], row + STEPS[i][1]
+            if 0 <= c < size and 0 <= r < size:
+                d = self.dist[r][c]
+                if d is not None and (best is None or d < best):
+                    best = d
+                    direction = i
+        return direction
+
+
+class AssetCache:
+    """Process-wide image cache.
+
+    Every image file is read and decoded once, and is kept converted to the display format
+    as soon as a display exists. Images packed by pack_atlas are subsurfaces of one atlas surface.
+    """
+    def __init__(self):
+        self.images = {}
+        self.converted = set()
+        self.atlas = None
+
+    def image(self, path):
+        img = self.images.get(path)
+        if img is None:
+            img = pygame.image.load(path)
+            self.images[path] = img
+        if path not in self.converted and pygame.display.get_surface() is not None:
+            if img.get_parent() is None:
+                img = img.convert_alpha()
+                self.images[path] = img
+            self.converted.add(path)
+        return img
+
+    def pack_atlas(self, paths):
+        """Packs the images into one row of a single converted atlas surface."""
+        images = [pygame.image.load(path) for path in paths]
+        width = sum(img.get_width() for img in images)
+        height = max(img.get_height() for img in images)
+        atlas = pygame.Surface((width, height), SRCALPHA)
+        x = 0
+        regions = []
+        for img in images:
+            atlas.blit(img, (x, 0))
+            regions.append(Rect(x, 0, img.get_width(), img.get_height()))
+            x += img.get_width()
+        if pygame.display.get_surface() is not None:
+            atlas = atlas.convert_alpha()
+        self.atlas = atlas
+        for path, region in zip(paths, regions):
+            self.images[path] = atlas.subsurface(region)
+            if pygame.display.get_surface() is not None:
+                self.converted.add(path)
+        return atlas
+
+
+assets = AssetCache()
+
+
+class GameObject(pygame.sprite.DirtySprite):
+    def __init__(self, img, x, y, tile_size, map_size, tile_map=None):
+        pygame.sprite.DirtySprite.__init__(self)
+        self.image = assets.image(img)
+        self.screen_rect = Rect(0, 0, tile_size, tile_size)
+        self.rect = self.screen_rect
         self.x = 0
         self.y = 0
         self.tick = 0
         self.tile_size = tile_size
         self.map_size = map_size
+        self.tile_map = tile_map
         self.set_coord(x, y)
 
     def set_coord(self, x, y):
         self.x = x
         self.y = y
-        self.screen_rect = Rect(floor(x) * self.tile_size, floor(y) * self.tile_size, self.tile_size, self.tile_size )
+        left, top = floor(x) * self.tile_size, floor(y) * self.tile_size
+        # The sprite is redrawn only when it moves to another tile
+        if left != self.screen_rect.x or top != self.screen_rect.y:
+            self.screen_rect.x = left
+            self.screen_rect.y = top
+            self.dirty = 1
+
+    def blocked(self):
+        return self.tile_map is not None and self.tile_map.is_wall(self.x, self.y)
 
     def game_tick(self):
         self.tick += 1
@@ -45,16 +225,21 @@ class GameObject(pygame.sprite.Sprite):
 
 
 class Ghost(GameObject):
-    def __init__(self, x, y, tile_size, map_size):
-        GameObject.__init__(self, './resources/ghost.png', x, y, tile_size, map_size)
+    def __init__(self, x, y, tile_size, map_size, tile_map=None, flow_field=None):
+        GameObject.__init__(self, './resources/ghost.png', x, y, tile_size, map_size, tile_map)
         self.direction = 0
         self.velocity = 4.0 / 10.0
+        # With a flow field the ghost chases its target, otherwise it wanders randomly
+        self.flow_field = flow_field
 
     def game_tick(self):
         super(Ghost, self).game_tick()
-        if self.tick % 20 == 0 or self.direction == 0:
+        if self.flow_field is not None:
+            self.direction = self.flow_field.direction(self.x, self.y)
+        elif self.tick % 20 == 0 or self.direction == 0:
             self.direction = random.randint(1, 4)
 
+        old_x, old_y = self.x, self.y
         if self.direction == 1:
             self.x += self.velocity
             if self.x >= self.map_size-1:
@@ -75,17 +260,82 @@ class Ghost(GameObject):
             if self.y <= 0:
                 self.y = 0
                 self.direction = random.randint(1, 4)
+        if self.blocked():
+            self.x, self.y = old_x, old_y
+            self.direction = random.randint(1, 4)
         self.set_coord(self.x, self.y)
 
 
+class GhostSwarm:
+    """Stress mode: any number of randomly wandering ghosts kept in NumPy arrays.
+
+    Follows the rules of Ghost.game_tick, but moves, clamps and redirects all ghosts
+    with array operations and draws them with a single Surface.blits call.
+    """
+    DX = np.array([s[0] for s in STEPS], dtype=float)
+    DY = np.array([s[1] for s in STEPS], dtype=float)
+
+    def __init__(self, n, tile_size, map_size, tile_map=None, velocity=4.0 / 10.0, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.tile_size = tile_size
+        self.map_size = map_size
+        self.walls = tile_map.wall_array() if tile_map is not None else None
+        if tile_map is not None:
+            tiles = np.array(tile_map.floor_tiles(), dtype=float)
+            spawn = tiles[self.rng.integers(0, len(tiles), n)]
+        else:
+            spawn = self.rng.integers(0, map_size, (n, 2)).astype(float)
+        self.x = spawn[:, 0].copy()
+        self.y = spawn[:, 1].copy()
+        self.direction = np.zeros(n, dtype=np.int8)
+        self.velocity = np.full(n, velocity)
+        self.tick = np.zeros(n, dtype=np.int64)
+        self.image = assets.image('./resources/ghost.png')
+
+    def __len__(self):
+        return len(self.x)
+
+    def redirect(self, mask):
+        self.direction[mask] = self.rng.integers(1, 5, np.count_nonzero(mask))
+
+    def game_tick(self):
+        self.tick += 1
+        self.redirect((self.tick % 20 == 0) | (self.direction == 0))
+
+        dx = self.DX[self.direction]
+        dy = self.DY[self.direction]
+        old_x, old_y = self.x.copy(), self.y.copy()
+        self.x += dx * self.velocity
+        self.y += dy * self.velocity
+
+        last = self.map_size - 1
+        hit = (((dx > 0) & (self.x >= last)) | ((dx < 0) & (self.x <= 0)) |
+               ((dy > 0) & (self.y >= last)) | ((dy < 0) & (self.y <= 0)))
+        np.clip(self.x, 0, last, out=self.x)
+        np.clip(self.y, 0, last, out=self.y)
+        if self.walls is not None:
+            blocked = self.walls[np.floor(self.y).astype(np.intp), np.floor(self.x).astype(np.intp)]
+            self.x[blocked] = old_x[blocked]
+            self.y[blocked] = old_y[blocked]
+            hit |= blocked
+        self.redirect(hit)
+
+    def draw(self, scr):
+        left = (np.floor(self.x) * self.tile_size).astype(int).tolist()
+        top = (np.floor(self.y) * self.tile_size).astype(int).tolist()
+        image = self.image
+        scr.blits([(image, pos) for pos in zip(left, top)], doreturn=False)
+
+
 class Pacman(GameObject):
-    def __init__(self, x, y, tile_size, map_size):
-        GameObject.__init__(self, './resources/pacman.png', x, y, tile_size, map_size)
+    def __init__(self, x, y, tile_size, map_size, tile_map=None):
+        GameObject.__init__(self, './resources/pacman.png', x, y, tile_size, map_size, tile_map)
         self.direction = 0
         self.velocity = 4.0 / 10.0
 
     def game_tick(self):
         super(Pacman, self).game_tick()
+        old_x, old_y = self.x, self.y
         if self.direction == 1:
             self.x += self.velocity
             if self.x >= self.map_size-1:
@@ -103,6 +353,8 @@ class Pacman(GameObject):
             if self.y <= 0:
                 self.y = 0
 
+        if self.blocked():
+            self.x, self.y = old_x, old_y
         self.set_coord(self.x, self.y)
 
 
@@ -124,20 +376,50 @@ def process_events(events, packman):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pacman')
+    parser.add_argument('--ghosts', type=int, default=1, help='number of ghosts')
+    parser.add_argument('--chase', action='store_true', help='ghosts chase pacman along the shortest path')
+    parser.add_argument('--swarm', type=int, default=0, metavar='N',
+                        help='stress mode: N randomly wandering ghosts in a vectorized swarm')
+    args = parser.parse_args()
+
     init_window()
+    assets.pack_atlas(['./resources/pacman.png', './resources/ghost.png', './resources/wall.png'])
     tile_size = 32
-    map_size = 16
-    ghost = Ghost(0, 0, tile_size, map_size)
-    pacman = Pacman(5, 5, tile_size, map_size)
-    background = None #pygame.image.load("./resources/background.png")
+    tile_map = TileMap.load('./resources/map.txt')
+    map_size = tile_map.size
+    flow_field = FlowField(tile_map, all_pairs=True) if args.chase else None
+    spawn_tiles = ([(0, 0)] + random.choices(tile_map.floor_tiles(), k=max(0, args.ghosts - 1)))[:args.ghosts]
+    ghosts = [Ghost(x, y, tile_size, map_size, tile_map, flow_field) for x, y in spawn_tiles]
+    pacman = Pacman(5, 5, tile_size, map_size, tile_map)
+    background = assets.image('./resources/background.png')
     screen = pygame.display.get_surface()
 
+    static = tile_map.bake(tile_size, background)
+
+    if args.swarm:
+        swarm = GhostSwarm(args.swarm, tile_size, map_size, tile_map)
+        while True:
+            process_events(pygame.event.get(), pacman)
+            pygame.time.delay(100)
+            swarm.game_tick()
+            pacman.game_tick()
+            screen.blit(static, (0, 0))
+            swarm.draw(screen)
+            pacman.draw(screen)
+            pygame.display.update()
+
+    sprites = pygame.sprite.LayeredDirty(pacman, *ghosts)
+    sprites.clear(screen, static)
+    screen.blit(static, (0, 0))
+    pygame.display.update()
+
     while True:
         process_events(pygame.event.get(), pacman)
         pygame.time.delay(100)
-        ghost.game_tick()
+        if flow_field is not None:
+            flow_field.update(pacman.x, pacman.y)
+        for ghost in ghosts:
+            ghost.game_tick()
         pacman.game_tick()
-        draw_background(screen, background)
-        pacman.draw(screen)
-        ghost.draw(screen)
-        pygame.display.update()
+        pygame.display.update(sprites.draw(screen))
@@ -1,4 +1,6 @@
+import argparse
 import math
+import numpy as np
 import pygame
 
 import random as rnd
@@ -6,11 +8,17 @@ import random as rnd
 from my_colors import *
 
 FPS = 20
+# Collision settings of the game loop, so that 10000 targets fit in a frame of 1/FPS.
+# A ball is checked against at most MAX_NEIGHBOURS balls of a band, a different
+# part of its sweep every frame, see sweep_and_prune.
+MAX_NEIGHBOURS = 8
+MAX_PASSES = 4
 GRAVITY_ACCELERATION = 9.8  # Gravitational acceleration for the projectile.
 SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
 
 class Cannon:
     max_velocity = 10
+    full_charge_time = 1000  # duration of the mouse click that gives max_velocity, ms
 
     def __init__(self, x, y):
         self.x = x
@@ -25,7 +33,19 @@ class Cannon:
         :param y: y-coordinate we are aiming at
         :return: None
         """
-        pass  #todo
+        self.direction = math.atan2(y - self.y, x - self.x)
+
+    def auto_aim(self, targets):
+        """
+        Turns the cannon to the shot at max_velocity that hits one of the targets soonest.
+        :param targets: a TargetField or a list of Target
+        :return: duration of the mouse click to pass to fire, ms, or None if no target can be hit
+        """
+        shot = solve_aim(self.x, self.y, targets, Cannon.max_velocity)
+        if shot is None:
+            return None
+        self.direction = shot[0]
+        return Cannon.full_charge_time
 
     def fire(self, dt):
         """
@@ -33,9 +53,16 @@ class Cannon:
         flying in the direction of the angle with a velocity depending 
         on the duration of the mouse click.
         :param dt: duration of the mouse click, ms
-        :return: an instance of a projectile of type Shell
+        :return: an instance of a projectile of type Shell, or None if there are no projectiles left
         """
-        pass
+        if self.shell_num is not None:
+            if self.shell_num <= 0:
+                return None
+            self.shell_num -= 1
+        velocity = Cannon.max_velocity * min(dt / Cannon.full_charge_time, 1)
+        shell = Shell(self.x, self.y, velocity * math.cos(self.direction), velocity * math.sin(self.direction))
+        shell.color = COLORS[rnd.randint(0, len(COLORS) - 1)]
+        return shell
 
     def draw(self):
         pygame.draw.circle(screen, self.color,
@@ -43,6 +70,7 @@ class Cannon:
 
 
 class Shell:
+    __slots__ = ("x", "y", "Vx", "Vy", "r", "color")
     standard_radius = 25
 
     def __init__(self, x, y, Vx, Vy):
@@ -75,11 +103,12 @@ class Shell:
         :param other: an object that should have fields x, y, r
         :return: a boolean value of type bool
         """
-        length = ((self.x - other.x)**2 + (self.y - other.y)**2)**0.5
-        return length <= self.r + other.r
+        dist2 = (self.x - other.x)**2 + (self.y - other.y)**2
+        return dist2 <= (self.r + other.r)**2
 
 
 class Target:
+    __slots__ = ("x", "y", "Vx", "Vy", "r", "color")
     standard_radius = 15
 
     def __init__(self, x, y, Vx, Vy):
@@ -101,7 +130,14 @@ class Target:
         self.y += self.Vy * dt
         self.Vx += ax * dt
         self.Vy += ay * dt
-        #todo: Target balls should bounce off the walls.
+        if self.x < self.r:
+            self.x, self.Vx = self.r, abs(self.Vx)
+        elif self.x > SCREEN_WIDTH - self.r:
+            self.x, self.Vx = SCREEN_WIDTH - self.r, -abs(self.Vx)
+        if self.y < self.r:
+            self.y, self.Vy = self.r, abs(self.Vy)
+        elif self.y > SCREEN_HEIGHT - self.r:
+            self.y, self.Vy = SCREEN_HEIGHT - self.r, -abs(self.Vy)
 
     def draw(self):
         pygame.draw.circle(screen, self.color,
@@ -109,20 +145,224 @@ class Target:
 
     def collide(self, other):
         """
-         Calculation of absolutely elastic collision
-        :param other:
+         Calculation of absolutely elastic collision. The masses of the balls are
+         proportional to r**2. Balls that do not touch or move apart are not changed.
+        :param other: another target ball
+        :return: True if the balls collided
+        """
+        dx, dy = other.x - self.x, other.y - self.y
+        dist2 = dx*dx + dy*dy
+        if dist2 == 0 or dist2 > (self.r + other.r)**2:
+            return False
+        dot = (other.Vx - self.Vx)*dx + (other.Vy - self.Vy)*dy
+        if dot >= 0:
+            return False
+        m1, m2 = self.r**2, other.r**2
+        k = 2*dot / ((m1 + m2)*dist2)
+        self.Vx += k*m2*dx
+        self.Vy += k*m2*dy
+        other.Vx -= k*m1*dx
+        other.Vy -= k*m1*dy
+        return True
+
+
+def sweep_and_prune(x, y, r, max_neighbours=None, rng=None):
+    """
+    Finds the pairs of balls whose bounding boxes may overlap.
+    The balls are cut into horizontal bands 2*max(r) high and sorted by
+    band and by the left edge x - r. Every ball is then swept along x
+    against the balls that follow it in its own band and in the next band,
+    stopping at the first ball whose left edge is past its right edge.
+    Every overlapping pair is returned.
+    :param x, y, r: NumPy arrays of the coordinates and radii
+    :param max_neighbours: if given, the most balls a ball is paired with in one band.
+        This keeps the number of pairs linear where balls pile up, but then
+        overlapping pairs can be missed.
+    :param rng: NumPy generator. With max_neighbours, the balls a ball is paired with
+        start at a random place of its sweep instead of the nearest one, so a pair
+        missed in one frame is found in later ones.
+    :return: two index arrays i, j, every candidate pair once
+    """
+    n = len(x)
+    if n < 2:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    r_max = r.max()
+    left, right = x - r, x + r
+    # The band number times band_span keeps the bands apart on one sorted axis.
+    band_span = right.max() - left.min() + 4*r_max + 1
+    base = np.floor(y / (2*r_max))*band_span - left.min() + 2*r_max
+    keys = base + left
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    base, left, right = base[order], left[order], right[order]
+    index = np.arange(n)
+    starts = np.concatenate((index + 1,
+                             np.searchsorted(keys, base + band_span + left - 2*r_max, "left")))
+    ends = np.concatenate((np.searchsorted(keys, base + right, "right"),
+                           np.searchsorted(keys, base + band_span + right, "right")))
+    counts = np.maximum(ends - starts, 0)
+    swept = counts
+    if max_neighbours is not None:
+        counts = np.minimum(counts, max_neighbours)
+    first = np.repeat(np.concatenate((index, index)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    if max_neighbours is not None and rng is not None:
+        shift = (rng.random(len(swept)) * swept).astype(int)
+        offsets = (offsets + np.repeat(shift, counts)) % np.repeat(swept, counts)
+    second = np.repeat(starts, counts) + offsets
+    return order[first], order[second]
+
+
+class TargetField:
+    """
+    Target balls kept in NumPy arrays, so that thousands of them can be
+    moved, collided and drawn within one frame.
+    """
+    sprite_cache = {}
+
+    def __init__(self, targets):
+        self.targets = targets
+        self.x = np.array([t.x for t in targets], dtype=np.float32)
+        self.y = np.array([t.y for t in targets], dtype=np.float32)
+        self.Vx = np.array([t.Vx for t in targets], dtype=np.float32)
+        self.Vy = np.array([t.Vy for t in targets], dtype=np.float32)
+        self.r = np.array([t.r for t in targets], dtype=np.float32)
+        self.sprites = [self.sprite(t.color, t.r) for t in targets]
+        self.rng = np.random.default_rng(0)
+
+    @classmethod
+    def sprite(cls, color, r):
+        """
+        Returns a surface with a ball of the given color and radius, shared by all equal balls.
+        """
+        cache = cls.sprite_cache
+        if (color, r) not in cache:
+            surface = pygame.Surface((2*r + 1, 2*r + 1))
+            surface.fill(BLACK)
+            surface.set_colorkey(BLACK, pygame.RLEACCEL)
+            pygame.draw.circle(surface, color, (r, r), r)
+            cache[(color, r)] = surface
+        return cache[(color, r)]
+
+    def move(self, dt):
+        """
+        Moves all target balls like Target.move does.
+        :param dt:
         :return:
         """
-        pass  #todo
+        ax, ay = 0, GRAVITY_ACCELERATION
+        self.x += self.Vx * dt
+        self.y += self.Vy * dt
+        self.Vx += ax * dt
+        self.Vy += ay * dt
+        for coord, vel, size in ((self.x, self.Vx, SCREEN_WIDTH), (self.y, self.Vy, SCREEN_HEIGHT)):
+            low, high = coord < self.r, coord > size - self.r
+            coord[low] = self.r[low]
+            vel[low] = np.abs(vel[low])
+            coord[high] = size - self.r[high]
+            vel[high] = -np.abs(vel[high])
+
+    def collide(self, max_passes=8, max_neighbours=None):
+        """
+        Calculation of absolutely elastic collisions between touching balls,
+        as in Target.collide. The contacts are resolved in passes: a pass takes
+        approaching pairs that share no ball and gives them their full impulses
+        at once, then the remaining pairs are checked again with the new velocities. Every impulse is a
+        whole elastic collision, so momentum and kinetic energy are kept.
+        Pairs still approaching after max_passes are left for the next frame.
+        :param max_passes: the most passes over the contacts
+        :param max_neighbours: passed to sweep_and_prune, trades missed contacts for speed in crowds
+        :return: number of collisions
+        """
+        i, j = sweep_and_prune(self.x, self.y, self.r, max_neighbours, self.rng)
+        dx, dy = self.x[j] - self.x[i], self.y[j] - self.y[i]
+        dist2 = dx*dx + dy*dy
+        hit = np.flatnonzero((dist2 <= (self.r[i] + self.r[j])**2) & (dist2 > 0))
+        # In random order, so that crowded balls don't all pick their pairs in the same direction.
+        hit = self.rng.permutation(hit)
+        i, j, dx, dy, dist2 = i[hit], j[hit], dx[hit], dy[hit], dist2[hit]
+        m1, m2 = self.r[i]**2, self.r[j]**2
+        Vx, Vy = self.Vx, self.Vy
+        owner = np.empty(len(self.x), dtype=int)
+        collisions = 0
+        for _ in range(max_passes):
+            dot = (Vx[j] - Vx[i])*dx + (Vy[j] - Vy[i])*dy
+            pending = np.flatnonzero(dot < 0)
+            if not len(pending):
+                break
+            # Every ball picks its last pending pair, a pair is taken if both its balls picked it.
+            order = np.arange(len(pending))
+            owner[np.stack((i[pending], j[pending]), axis=1).ravel()] = np.repeat(order, 2)
+            p = order[(owner[i[pending]] == order) & (owner[j[pending]] == order)]
+            if not len(p):
+                p = order[:1]
+            p = pending[p]
+            k = 2*dot[p] / ((m1[p] + m2[p])*dist2[p])
+            Vx[i[p]] += k*m2[p]*dx[p]
+            Vy[i[p]] += k*m2[p]*dy[p]
+            Vx[j[p]] -= k*m1[p]*dx[p]
+            Vy[j[p]] -= k*m1[p]*dy[p]
+            collisions += len(p)
+        return collisions
+
+    def draw(self):
+        # The corners are made one by one while blitting: a list of 10000 of them would start the
+        # garbage collector almost every frame.
+        left = np.rint(self.x - self.r).astype(int).tolist()
+        top = np.rint(self.y - self.r).astype(int).tolist()
+        screen.blits(zip(self.sprites, zip(left, top)), doreturn=False)
+
+    def sync(self):
+        """
+        Writes the coordinates and velocities back to the Target objects.
+        """
+        for target, x, y, Vx, Vy in zip(self.targets, self.x.tolist(), self.y.tolist(),
+                                         self.Vx.tolist(), self.Vy.tolist()):
+            target.x, target.y, target.Vx, target.Vy = x, y, Vx, Vy
+
+
+def solve_aim(x, y, targets, velocity):
+    """
+    Finds the shot from (x, y) with the given speed that hits one of the targets soonest.
+    The projectile and the target balls fall with the same acceleration, so relative
+    to each other they move along straight lines. The projectile meets a target at the
+    time t when its velocity V = Vt - (p - pt)/t has the given length, a root of
+    (|Vt|**2 - velocity**2)*t**2 - 2*(Vt, p - pt)*t + |p - pt|**2 = 0.
+    All targets are solved at once with NumPy. Bounces off the walls are not predicted.
+    :param targets: a TargetField or a list of Target
+    :return: (direction, time of impact, index of the target), or None if no target can be hit
+    """
+    if isinstance(targets, TargetField):
+        tx, ty, tvx, tvy = targets.x, targets.y, targets.Vx, targets.Vy
+    else:
+        tx, ty, tvx, tvy = np.array([(t.x, t.y, t.Vx, t.Vy) for t in targets], dtype=float).reshape(-1, 4).T
+    if len(tx) == 0:
+        return None
+    rx, ry = x - tx, y - ty
+    a = tvx*tvx + tvy*tvy - velocity**2
+    b = tvx*rx + tvy*ry
+    c = rx*rx + ry*ry
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = np.sqrt(b*b - a*c)
+        times = np.stack(((b - root) / a, (b + root) / a))
+    times[~(times > 0)] = np.inf
+    t = times.min(axis=0)
+    j = int(np.argmin(t))
+    if not np.isfinite(t[j]):
+        return None
+    t = t[j].item()
+    return math.atan2(tvy[j] - ry[j]/t, tvx[j] - rx[j]/t), t, j
+
 
 class Bomb:
     pass
 
 def generate_random_targets(number: int):
     targets = []
+    r = Target.standard_radius
     for i in range(number):
-        x = rnd.randint(0, SCREEN_HEIGHT)
-        y = rnd.randint(0, SCREEN_HEIGHT)
+        x = rnd.randint(r, SCREEN_WIDTH - r)
+        y = rnd.randint(r, SCREEN_HEIGHT - r)
         Vx = rnd.randint(-30, +30)
         Vy = rnd.randint(-30, +30)
         target = Target(x, y, Vx, Vy)
@@ -130,9 +370,9 @@ def generate_random_targets(number: int):
     return targets
 
 
-def game_main_loop():
+def game_main_loop(number_of_targets=10):
 
-    targets = generate_random_targets(10)
+    targets = TargetField(generate_random_targets(number_of_targets))
 
     clock = pygame.time.Clock()
     finished = False
@@ -149,18 +389,20 @@ def game_main_loop():
         pygame.display.update()
         screen.fill(GRAY)
 
-        for target in targets:
-            target.move(dt)
-
-        for target in targets:
-            target.draw()
+        targets.move(dt)
+        targets.collide(MAX_PASSES, MAX_NEIGHBOURS)
+        targets.draw()
 
     pygame.quit()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", type=int, default=10, help="number of target balls")
+    args = parser.parse_args()
+
     pygame.init()
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.update()
 
-    game_main_loop()
\ No newline at end of file
+    game_main_loop(args.targets)
\ No newline at end of file
@@ -0,0 +1,76 @@
+import importlib.util
+import os
+import random
+
+import numpy as np
+
+spec = importlib.util.spec_from_file_location(
+    "dragons", os.path.join(os.path.dirname(os.path.abspath(__file__)), "01_class.py"))
+dragons = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(dragons)
+
+
+def reference_battle(n_dragons, events):
+    """Applies the events one by one to Dragon objects, as main() would."""
+    enemies = [dragons.Dragon(str(i)) for i in range(n_dragons)]
+    deaths = []
+    for k, (i, damage) in enumerate(events):
+        if not enemies[i].is_alive():
+            continue
+        enemies[i].get_damage(damage)
+        if not enemies[i].is_alive():
+            deaths.append([k, i])
+    return deaths, [enemy.health for enemy in enemies]
+
+
+def check_battle(n_dragons, events, chunk_size):
+    pool = dragons.DragonPool([str(i) for i in range(n_dragons)])
+    deaths, n_events = dragons.battle(pool, events, chunk_size)
+    expected_deaths, expected_health = reference_battle(n_dragons, events)
+    assert n_events == len(events)
+    assert deaths.tolist() == expected_deaths
+    assert pool.health.tolist() == expected_health
+
+
+def test_heals():
+    # A negative damage heals, and healing may take a dragon above 100
+    check_battle(2, [(0, 30), (0, -50), (0, 110), (0, 11), (1, -10), (1, 110)], 100)
+
+
+def test_hits_on_dead_dragons():
+    # Heals and hits after the death are ignored, the dragon stays dead
+    check_battle(2, [(0, 100), (0, -50), (0, 10), (1, 60), (1, 60), (1, -100)], 100)
+
+
+def test_events_split_across_chunks():
+    events = [(0, 40), (1, 30), (0, 40), (1, -20), (0, 40), (1, 100), (1, 5)]
+    for chunk_size in range(1, len(events) + 1):
+        check_battle(2, events, chunk_size)
+
+
+def test_random_battles():
+    rng = random.Random(0)
+    for _ in range(50):
+        n_dragons = rng.randint(1, 5)
+        events = [(rng.randrange(n_dragons), rng.randint(-20, 60)) for _ in range(rng.randint(0, 60))]
+        check_battle(n_dragons, events, rng.randint(1, 20))
+
+
+def test_event_sources(tmp_path):
+    events = [(0, 70), (1, 20), (0, 40), (1, 90)]
+    path = tmp_path / "events.txt"
+    path.write_text("".join("{} {}\n".format(i, damage) for i, damage in events))
+    for source in (events, iter(events), np.array(events), str(path)):
+        pool = dragons.DragonPool(["Smog", "Hidra"])
+        deaths, n_events = dragons.battle(pool, source, chunk_size=3)
+        assert n_events == 4
+        assert deaths.tolist() == [[2, 0], [3, 1]]
+        assert pool.final_cry(deaths[:, 1]) == "Smog is dead...\nHidra is dead...\n"
+
+
+def test_no_events():
+    pool = dragons.DragonPool(["Smog"])
+    deaths, n_events = dragons.battle(pool, [])
+    assert n_events == 0
+    assert deaths.shape == (0, 2)
+    assert pool.is_alive().all()
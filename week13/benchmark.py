@@ -0,0 +1,239 @@
+"""Scaling benchmark for the week13 game loop.
+
+Drives Manager from cannon.py under the SDL dummy video driver with growing numbers of
+shells and targets, reports per-phase frame time, frames per second and peak memory,
+and saves the results as JSON, so runs can be compared between revisions.
+
+Usage:
+    python benchmark.py --sizes 1 10 100 1000 5000 --out results.json
+    python benchmark.py --state midgame.bin --out results.json
+    python benchmark.py --compare old.json new.json
+    python benchmark.py --startup 10
+"""
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pygame as pg
+
+import cannon
+
+PHASES = ("move", "collide", "draw", "score_draw")
+# The largest size has more shells than cannon.SPRITES keeps sprites, so a sprite cache that only works
+# while everything fits in it shows up as a jump in draw time
+SIZES = (1, 10, 100, 1000, 5000)
+
+# Cold start: a fresh interpreter imports the game, opens the window and draws the first frame
+STARTUP_TARGET_MS = 400
+STARTUP_SCRIPT = """
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame as pg
+import cannon
+pg.display.init()
+cannon.Manager(n_targets=2).draw(pg.display.set_mode(cannon.SCREEN_SIZE))
+"""
+
+
+def revision():
+    """Returns the git revision of the working tree, or 'unknown' outside of a repository."""
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return "unknown"
+    return out.stdout.strip() or "unknown"
+
+
+def make_manager(size, seed=0):
+    """Creates a Manager with `size` targets of every type and `size` shells in flight."""
+    random.seed(seed)
+    mgr = cannon.Manager(n_targets=size)
+    for _ in range(size):
+        mgr.gun.set_angle([random.uniform(0, cannon.SCREEN_SIZE[0]), random.uniform(0, cannon.SCREEN_SIZE[1] // 2)])
+        mgr.gun.pow = random.randint(mgr.gun.min_pow, mgr.gun.max_pow)
+        mgr.gun.p_type = random.randint(0, 2)
+        mgr.balls.append(mgr.gun.strike())
+    return mgr
+
+
+def count_entities(mgr):
+    """Counts live entities of every type."""
+    counts = {"Shell": len(mgr.balls)}
+    for target in mgr.targets:
+        name = type(target).__name__
+        counts[name] = counts.get(name, 0) + 1
+    counts["TargetBombs"] = len(mgr.bombs)
+    return counts
+
+
+class PhaseTimer:
+    """Wraps ScoreTable.sprite to measure the time of composing the scoreboard separately from the rest
+    of Manager.draw."""
+    def __init__(self, func):
+        """Constructor method. Sets the wrapped function."""
+        self.func = func
+        self.elapsed = 0
+
+    def __call__(self, *args):
+        start = time.perf_counter_ns()
+        result = self.func(*args)
+        self.elapsed += time.perf_counter_ns() - start
+        return result
+
+
+def run_frames(mgr, screen, frames):
+    """Runs the given number of frames and returns the total time of every phase, ns."""
+    totals = dict.fromkeys(PHASES, 0)
+    score_timer = PhaseTimer(mgr.score_t.sprite)
+    mgr.score_t.sprite = score_timer
+    clock = time.perf_counter_ns
+    for _ in range(frames):
+        screen.fill(cannon.BLACK)
+        t0 = clock()
+        mgr.move()
+        t1 = clock()
+        mgr.collide()
+        t2 = clock()
+        mgr.draw(screen)
+        t3 = clock()
+        totals["move"] += t1 - t0
+        totals["collide"] += t2 - t1
+        totals["draw"] += t3 - t2
+    del mgr.score_t.sprite
+    totals["score_draw"] = score_timer.elapsed
+    totals["draw"] -= score_timer.elapsed
+    return totals
+
+
+def bench_size(size, screen, frames, warmup, seed, state=None):
+    """Benchmarks one population size, or a saved state. Timing and memory are measured in separate runs."""
+    mgr = cannon.Manager.load(state) if state else make_manager(size, seed)
+    run_frames(mgr, screen, warmup)
+    counts = count_entities(mgr)
+    totals = run_frames(mgr, screen, frames)
+    frame_ns = sum(totals.values())
+
+    mgr = cannon.Manager.load(state) if state else make_manager(size, seed)
+    run_frames(mgr, screen, warmup)
+    tracemalloc.start()
+    run_frames(mgr, screen, frames)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "size": size,
+        "entities": counts,
+        "phase_ms": {name: totals[name] / frames / 1e6 for name in PHASES},
+        "frame_ms": frame_ns / frames / 1e6,
+        "fps": frames * 1e9 / frame_ns if frame_ns else float("inf"),
+        "peak_memory_bytes": peak,
+    }
+
+
+def run(sizes, frames, warmup, seed, state=None):
+    """Runs the benchmark for all sizes and returns the results as a dict.
+
+    With a saved state, a single run starts from it, reported as size 0.
+    """
+    pg.init()
+    screen = pg.display.set_mode(cannon.SCREEN_SIZE)
+    results = []
+    for size in ([0] if state else sizes):
+        result = bench_size(size, screen, frames, warmup, seed, state)
+        print_result(result)
+        results.append(result)
+    pg.quit()
+    return {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "pygame": pg.version.ver,
+        "numpy": np.__version__,
+        "frames": frames,
+        "warmup": warmup,
+        "seed": seed,
+        "state": state,
+        "results": results,
+    }
+
+
+def print_result(result):
+    """Prints one line of results."""
+    phases = "  ".join("{} {:8.3f}".format(name, result["phase_ms"][name]) for name in PHASES)
+    print("size {:6d}  {}  frame {:8.3f} ms  {:8.1f} fps  peak {:8.1f} KiB".format(
+        result["size"], phases, result["frame_ms"], result["fps"], result["peak_memory_bytes"] / 1024))
+
+
+def startup(runs):
+    """Starts the game in fresh interpreters and returns their wall times, ms.
+
+    One run is done before measuring, so the font cache file exists, as it does for every start but the first.
+    """
+    times = []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                       capture_output=True, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times[1:]
+
+
+def compare(old_path, new_path):
+    """Prints the ratio of new to old frame and phase times for every size present in both files."""
+    with open(old_path) as f:
+        old = {r["size"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    for result in new:
+        base = old.get(result["size"])
+        if base is None:
+            continue
+        ratios = "  ".join("{} x{:.2f}".format(name, result["phase_ms"][name] / base["phase_ms"][name])
+                           for name in PHASES if base["phase_ms"][name])
+        print("size {:6d}  frame x{:.2f}  {}".format(result["size"], result["frame_ms"] / base["frame_ms"], ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES),
+                        help="number of shells and of targets of every type")
+    parser.add_argument("--frames", type=int, default=100, help="measured frames per size")
+    parser.add_argument("--warmup", type=int, default=10, help="frames run before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--state", metavar="FILE", help="start from a game state saved with cannon.py --save")
+    parser.add_argument("--out", default="benchmark.json", help="where to save the results")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two saved result files")
+    parser.add_argument("--startup", type=int, metavar="RUNS", help="measure the cold start time of RUNS games")
+    parser.add_argument("--startup-target", type=float, default=STARTUP_TARGET_MS, metavar="MS",
+                        help="maximum median cold start time, ms")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if args.startup:
+        times = startup(args.startup)
+        median = statistics.median(times)
+        print("cold start  median {:.1f} ms  min {:.1f} ms  max {:.1f} ms  target {:.0f} ms: {}".format(
+            median, min(times), max(times), args.startup_target, "met" if median <= args.startup_target else "MISSED"))
+        sys.exit(median > args.startup_target)
+    report = run(args.sizes, args.frames, args.warmup, args.seed, args.state)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Saved to", args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Batched environment for evaluating tank policies on many week13 games at once.
+
+BatchEnv steps N independent, seeded worlds in lockstep. Each world is a headless Manager from
+cannon.py, and the policy plays the player's tank. Actions come in as one array row per world,
+observations and rewards go out as arrays. With processes > 0 the worlds are split between
+worker processes.
+
+Example:
+    with BatchEnv(64, seed=1, processes=4) as env:
+        obs = env.reset()
+        for _ in range(1000):
+            obs, rewards = env.step(policy(obs))
+"""
+import math
+import multiprocessing as mp
+
+import numpy as np
+
+import cannon
+
+# Columns of an action row
+MOVE, ANGLE, CHARGE, FIRE, P_TYPE = range(5)
+N_ACTIONS = 5
+
+# Columns of an observation row, followed by (x, y, rad) of the nearest targets
+OBS_FIELDS = ("gun_x", "gun_y", "angle", "pow", "p_type", "balls", "targets", "bombs",
+              "t_destr", "b_used", "score")
+
+
+class WorldBatch:
+    """Worlds stepped in the current process."""
+    def __init__(self, seeds, n_targets=2, n_nearest=4):
+        """Constructor method. Sets the seeds of the worlds, number of targets and of observed targets."""
+        self.seeds = list(seeds)
+        self.n_targets = n_targets
+        self.n_nearest = n_nearest
+        self.worlds = []
+        self.scores = np.zeros(len(self.seeds))
+
+    def reset(self):
+        """Starts every world from its seed. Returns the observations."""
+        self.worlds = [cannon.Manager(n_targets=self.n_targets, seed=seed) for seed in self.seeds]
+        self.scores = np.zeros(len(self.worlds))
+        return self.observe()
+
+    def step(self, actions):
+        """Applies one action row to every world and runs one tick. Returns observations and rewards."""
+        for mgr, (move, angle, charge, fire, p_type) in zip(self.worlds, actions.tolist()):
+            if move:
+                mgr.gun.move(40 * int(math.copysign(1, move)))
+            mgr.gun.angle = angle
+            mgr.set_projectile(int(p_type) % len(cannon.PROJECTILES))
+            if charge:
+                mgr.gun.activate()
+            if fire:
+                mgr.fire()
+            mgr.step()
+        obs = self.observe()
+        scores = obs[:, OBS_FIELDS.index("score")]
+        rewards = scores - self.scores
+        self.scores = scores
+        return obs, rewards
+
+    def observe(self):
+        """Returns the observation array, one row per world."""
+        obs = np.zeros((len(self.worlds), len(OBS_FIELDS) + 3 * self.n_nearest))
+        for row, mgr in zip(obs, self.worlds):
+            gun, score_t = mgr.gun, mgr.score_t
+            row[:len(OBS_FIELDS)] = (gun.x, gun.y, gun.angle, gun.pow, gun.p_type, len(mgr.balls),
+                                     len(mgr.targets), len(mgr.bombs), score_t.t_destr, score_t.b_used,
+                                     score_t.score())
+            if mgr.targets and self.n_nearest:
+                targets = np.array([(t.x, t.y, t.rad) for t in mgr.targets], dtype=float)
+                dist = (targets[:, 0] - gun.x)**2 + (targets[:, 1] - gun.y)**2
+                nearest = targets[np.argsort(dist)[:self.n_nearest]]
+                row[len(OBS_FIELDS):len(OBS_FIELDS) + nearest.size] = nearest.ravel()
+        return obs
+
+
+def worker(conn, seeds, n_targets, n_nearest):
+    """Runs a WorldBatch in a worker process, answering commands from the pipe."""
+    batch = WorldBatch(seeds, n_targets, n_nearest)
+    while True:
+        command, data = conn.recv()
+        if command == "reset":
+            conn.send(batch.reset())
+        elif command == "step":
+            conn.send(batch.step(data))
+        elif command == "close":
+            conn.close()
+            break
+
+
+class BatchEnv:
+    """N independent, seeded week13 worlds stepped in lockstep."""
+    def __init__(self, n_worlds, seed=0, n_targets=2, n_nearest=4, processes=0):
+        """Constructor method.
+
+        :param n_worlds: number of worlds
+        :param seed: base seed, world i is seeded with seed + i
+        :param n_targets: number of targets of every type in a mission
+        :param n_nearest: number of nearest targets included in an observation
+        :param processes: number of worker processes, 0 runs all worlds in the current process
+        """
+        self.n_worlds = n_worlds
+        seeds = [seed + i for i in range(n_worlds)]
+        self.local = None
+        self.pipes = []
+        self.processes = []
+        self.bounds = [0]
+        if processes:
+            for chunk in np.array_split(seeds, min(processes, n_worlds)):
+                parent, child = mp.Pipe()
+                proc = mp.Process(target=worker, args=(child, chunk.tolist(), n_targets, n_nearest), daemon=True)
+                proc.start()
+                child.close()
+                self.pipes.append(parent)
+                self.processes.append(proc)
+                self.bounds.append(self.bounds[-1] + len(chunk))
+        else:
+            self.local = WorldBatch(seeds, n_targets, n_nearest)
+
+    def reset(self):
+        """Starts all worlds from their seeds. Returns the observations, one row per world."""
+        if self.local is not None:
+            return self.local.reset()
+        for pipe in self.pipes:
+            pipe.send(("reset", None))
+        return np.concatenate([pipe.recv() for pipe in self.pipes])
+
+    def step(self, actions):
+        """Runs one tick of every world.
+
+        :param actions: array of shape (n_worlds, 5) with columns move (-1, 0 or 1), angle (radians),
+            charge (start charging if nonzero), fire (fire if nonzero) and projectile type (0, 1 or 2)
+        :return: observations of shape (n_worlds, n_features) and rewards of shape (n_worlds,),
+            the change of each world's ScoreTable.score() during the tick
+        """
+        actions = np.asarray(actions, dtype=float)
+        if actions.shape != (self.n_worlds, N_ACTIONS):
+            raise ValueError("actions must have shape {}, got {}".format((self.n_worlds, N_ACTIONS), actions.shape))
+        if self.local is not None:
+            return self.local.step(actions)
+        for pipe, start, stop in zip(self.pipes, self.bounds, self.bounds[1:]):
+            pipe.send(("step", actions[start:stop]))
+        results = [pipe.recv() for pipe in self.pipes]
+        return np.concatenate([obs for obs, _ in results]), np.concatenate([rewards for _, rewards in results])
+
+    def close(self):
+        """Stops the worker processes."""
+        for pipe in self.pipes:
+            pipe.send(("close", None))
+            pipe.close()
+        for proc in self.processes:
+            proc.join()
+        self.pipes = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
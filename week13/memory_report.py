@@ -0,0 +1,93 @@
+"""Memory footprint report for the week13 game entities.
+
+Prints the number of live entities of every type, bytes per entity and the total live entity memory.
+Sizes are approximate: an entity is counted with the containers and numbers it owns, while shared
+objects such as colors, the stores and the pools themselves are not counted. Shells and bombs kept in
+NumPy arrays are counted with their share of the array memory.
+
+Usage:
+    python memory_report.py --count 100000
+"""
+import argparse
+import sys
+
+import cannon
+
+NUMBER_TYPES = (int, float)
+
+
+def owned_size(value):
+    """Returns the size of a value owned by one entity: a number or a coordinate container."""
+    if isinstance(value, NUMBER_TYPES) and not (isinstance(value, int) and -5 <= value <= 256):
+        return sys.getsizeof(value)
+    if isinstance(value, list):
+        return sys.getsizeof(value) + sum(owned_size(item) for item in value)
+    return 0
+
+
+def attributes(obj):
+    """Returns values of the instance attributes of an object, kept in __slots__ or in __dict__."""
+    values = list(getattr(obj, "__dict__", {}).values())
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if hasattr(obj, name):
+                values.append(getattr(obj, name))
+    return values
+
+
+def entity_size(obj):
+    """Returns the approximate number of bytes an entity takes."""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    size += sum(owned_size(value) for value in attributes(obj))
+    if isinstance(obj, cannon.Shell) and obj.store is not None:
+        size += slot_size(obj.store, ("coord", "prev_coord", "contact", "toi_wall", "vel", "rad", "p_type", "alive"))
+    return size
+
+
+def slot_size(store, names):
+    """Returns the number of bytes one slot takes in the arrays of a store."""
+    return sum(getattr(store, name)[0].nbytes for name in names)
+
+
+def live_entities(mgr):
+    """Returns all live entities of a manager, except the bombs kept in its pool."""
+    return list(mgr.balls) + list(mgr.targets) + [mgr.gun, mgr.bot_tank]
+
+
+def report(entities, bomb_pool=None, out=sys.stdout):
+    """Prints bytes per entity type and the total live entity memory. Returns the total, bytes."""
+    stats = {}
+    for obj in entities:
+        name = type(obj).__name__
+        count, size = stats.get(name, (0, 0))
+        stats[name] = (count + 1, size + entity_size(obj))
+    if bomb_pool is not None and len(bomb_pool):
+        per_bomb = slot_size(bomb_pool, ("coord", "prev_coord", "vel", "alive"))
+        stats["TargetBombs (pooled)"] = (len(bomb_pool), per_bomb * len(bomb_pool))
+
+    total = 0
+    print("{:<22} {:>10} {:>14} {:>14}".format("type", "count", "bytes/entity", "total bytes"), file=out)
+    for name, (count, size) in sorted(stats.items()):
+        print("{:<22} {:>10} {:>14.1f} {:>14}".format(name, count, size / count, size), file=out)
+        total += size
+    print("{:<22} {:>10} {:>14} {:>14}".format("total", sum(c for c, _ in stats.values()), "", total), file=out)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000, help="number of entities of every type")
+    args = parser.parse_args()
+
+    mgr = cannon.Manager(n_targets=args.count)
+    for _ in range(args.count):
+        mgr.balls.append(mgr.gun.strike())
+    for _ in range(args.count):
+        mgr.bombs.spawn((0, 0))
+    report(live_entities(mgr), mgr.bombs)
+
+
+if __name__ == "__main__":
+    main()